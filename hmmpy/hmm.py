@@ -1,28 +1,217 @@
 import numpy as np  # Arrays
-from numpy import ma  # To handle logarithm if small values
-from numpy.linalg import det  # For use with the multivariate normal covariance matrix
 
 from tqdm import trange  # Keeping track of reestimation
 
 from scipy.stats import multivariate_normal  # For use in Gaussian HMMs
+from scipy.special import logsumexp  # For the forward algorithm in log-space
+from scipy.linalg import solve_triangular  # For batched Gaussian densities
 
 from itertools import product
-from functools import reduce
 from functools import partial
 
+from concurrent.futures import ThreadPoolExecutor  # Parallel emission matrices
+
 from abc import ABC, abstractmethod
 
 import warnings
 
+try:
+    from numba import njit, prange  # Optional, compiles the recursions if available
+    from numba.core.dispatcher import Dispatcher
+except ImportError:
+    njit = None
+    Dispatcher = None
+
+
+def _vectorized_eval(function, shape, *args):
+    """Try to evaluate a user supplied probability function on whole arrays at once.
+    Returns None if the function does not accept arrays or does not broadcast to the expected shape,
+    in which case the caller should fall back to evaluating element by element.
+    """
+    if not all(np.ndim(arg) == len(shape) for arg in args):
+        return None
+    try:
+        with np.errstate(all="ignore"):
+            result = np.asarray(function(*args), dtype=float)
+    except Exception:
+        return None
+    if result.shape != shape:
+        return None
+    return result
+
+
+def _as_array(values, exact=False):
+    """Converts a list of states or observations to a 1-dimensional array.
+    Returns None for ragged or nested values, and for values numpy would coerce to strings, e.g. [0, "a"],
+    in which case the caller should work with the original list. Numbers may be promoted to a common type,
+    e.g. [0, 1.5] to floats, unless exact is set, which checks that every element survives the round-trip.
+    """
+    if isinstance(values, np.ndarray):
+        return values if values.ndim == 1 else None
+    try:
+        array = np.asarray(values)
+    except (ValueError, TypeError):
+        return None
+    if array.ndim != 1:
+        return None
+    if exact:
+        if not all(
+            type(a) is type(b) and a == b for a, b in zip(array.tolist(), values)
+        ):
+            return None
+    elif array.dtype.kind in "US":
+        if not all(isinstance(value, (str, bytes)) for value in values):
+            return None
+    return array
+
+
+def _symbol_ids(z, symbol_id_dictionary):
+    """Returns an array with the symbol ID of each observation in z, looked up in symbol_id_dictionary."""
+    if isinstance(z, np.ndarray) and z.ndim == 1 and z.dtype.kind in "biufUS":
+        # Only look up each distinct symbol once, arrays need no check for coerced elements
+        symbols, inverse = np.unique(z, return_inverse=True)
+        ids = np.array([symbol_id_dictionary[s] for s in symbols.tolist()], dtype=int)
+        return ids[inverse.reshape(-1)]
+    # A dictionary lookup per observation is faster for lists than converting them to an array
+    return np.fromiter(
+        (symbol_id_dictionary[symbol] for symbol in z),
+        dtype=int,
+        count=len(z),
+    )
+
+
+def _log(x):
+    """Elementwise natural logarithm of probabilities in a single pass, where zero probabilities become -inf.
+    Writes into a buffer prefilled with -inf and skips the zeros, so no divide-by-zero warnings are raised.
+    """
+    x = np.asarray(x)
+    if x.dtype.kind != "f":
+        x = x.astype(float)
+    return np.log(x, where=x > 0, out=np.full_like(x, -np.inf))
+
+
+if njit is not None:
+
+    @njit(cache=True, nogil=True)
+    def _log_viterbi_kernel(log_P, log_l, log_pi, phi):
+        """Compiled Viterbi recursion and traceback in log-space. Returns the state IDs of the best path.
+        phi is an (N, M) integer buffer for the back-pointers, allocated by the caller.
+        """
+        N, M = log_l.shape
+        delta = np.empty((N, M), dtype=log_l.dtype)
+
+        for j in range(M):
+            delta[0, j] = log_pi[j] + log_l[0, j]
+            phi[0, j] = 0
+
+        for n in range(1, N):
+            for j in range(M):
+                best = -np.inf
+                best_i = 0
+                for i in range(M):
+                    score = delta[n - 1, i] + log_P[i, j]
+                    if score > best:
+                        best = score
+                        best_i = i
+                delta[n, j] = best + log_l[n, j]
+                phi[n, j] = best_i
+
+        return _backtrack_kernel(phi, np.argmax(delta[N - 1, :]))
+
+    @njit(cache=True, nogil=True)
+    def _backtrack_kernel(phi, last):
+        """Compiled Viterbi traceback. Follows the back-pointers in phi from the last state ID."""
+        N = phi.shape[0]
+        q_star = np.empty(N, dtype=np.int32)
+        q_star[N - 1] = last
+        for n in range(N - 2, -1, -1):
+            q_star[n] = phi[n + 1, q_star[n + 1]]
+        return q_star
+
+    @njit(cache=True, nogil=True)
+    def _forward_kernel(P_T, l, pi, alpha, c):
+        """Compiled scaled forward recursion. Fills alpha and the scalings c in place.
+        Takes the transpose of the transition matrix, so that the inner sum runs over contiguous memory.
+        """
+        N, M = l.shape
+        total = 0.0
+        for j in range(M):
+            alpha[0, j] = l[0, j] * pi[j]
+            total += alpha[0, j]
+        c[0] = 1.0 / total
+        for j in range(M):
+            alpha[0, j] *= c[0]
+
+        for n in range(N - 1):
+            total = 0.0
+            for j in range(M):
+                s = 0.0
+                for i in range(M):
+                    s += P_T[j, i] * alpha[n, i]
+                alpha[n + 1, j] = s * l[n + 1, j]
+                total += alpha[n + 1, j]
+            c[n + 1] = 1.0 / total
+            for j in range(M):
+                alpha[n + 1, j] *= c[n + 1]
+
+    @njit(cache=True, nogil=True)
+    def _backward_kernel(P, l, c, beta):
+        """Compiled scaled backward recursion. Fills beta in place."""
+        N, M = l.shape
+        for i in range(M):
+            beta[N - 1, i] = c[N - 1]
+
+        for n in range(N - 2, -1, -1):
+            for i in range(M):
+                s = 0.0
+                for j in range(M):
+                    s += P[i, j] * l[n + 1, j] * beta[n + 1, j]
+                beta[n, i] = s * c[n]
+
+    @njit(parallel=True)
+    def _parallel_emission_kernel(emission_probability, z, states):
+        """Builds the emission matrix from a compiled emission probability, with rows split across threads."""
+        N = z.shape[0]
+        M = states.shape[0]
+        l_array = np.empty((N, M))
+        for n in prange(N):
+            for m in range(M):
+                l_array[n, m] = emission_probability(z[n], states[m])
+        return l_array
+
+else:
+    _log_viterbi_kernel = None
+    _backtrack_kernel = None
+    _forward_kernel = None
+    _backward_kernel = None
+    _parallel_emission_kernel = None
+
 
 class EmissionProbabilityBase(ABC):
     @abstractmethod
     def eval_to_array(self, z, x):
         pass
 
-    @abstractmethod
+    def eval_matrix(self, z):
+        """Returns the emission probabilities of all observations in z for all states, as an (N, M) array.
+        Evaluates eval_to_array one observation at a time, subclasses override this to evaluate the whole sequence in one go.
+        """
+        l_array = np.empty((len(z), len(self.state_ids)))
+        for n, observation in enumerate(z):
+            l_array[n, :] = self.eval_to_array(observation, self.state_ids)
+        return l_array
+
     def l(self, z):
-        pass
+        """Creates a 2-dimensional array of emission probabilities for the observations at various times, for various states.
+        
+        Parameters:
+        ---
+        z -- A list of observations of the type expected by the InitialProbability class.
+        """
+        l_array = self.eval_matrix(z)
+        # This is a hacky solution to a problem that should probably be handled in different manner.
+        # The underlying is issue is that zero, or close to zero, values, are propogated throughout the algorithm and leads to division by zero at later stages.
+        return np.clip(l_array, a_min=1e-9, a_max=None)
 
 
 class InitialProbability:
@@ -41,14 +230,23 @@ class InitialProbability:
         """
         self.states = states
         self.state_ids = np.arange(self.M)
-        self.pi_function = initial_probability
         self.enable_warnings = enable_warnings
+        self.pi_function = initial_probability
 
     def eval_to_array(self, pi_function, x):
         """Get corresponding initial probability for states identified by state IDs in x. 
         State IDs is the index of the states in the list passed in the constructor. 
         """
-        return np.array(list(map(lambda x: pi_function(self.states[x]), x)))
+        states_array = _as_array(self.states)
+        if states_array is not None:
+            pi = _vectorized_eval(pi_function, x.shape, states_array[x])
+            if pi is not None:
+                return pi
+        return np.fromiter(
+            (pi_function(self.states[state_id]) for state_id in x),
+            dtype=float,
+            count=len(x),
+        )
 
     @property
     def M(self):
@@ -70,15 +268,23 @@ class InitialProbability:
     def pi(self, value):
         unscaled_pi = value
         scaled_pi = unscaled_pi / np.sum(unscaled_pi)
-        if (
-            not np.all(np.isclose(unscaled_pi, scaled_pi, atol=1e-3))
-            and self.enable_warnings
+        # Only compare the arrays if there is a warning to show
+        if self.enable_warnings and not np.all(
+            np.isclose(unscaled_pi, scaled_pi, atol=1e-3)
         ):
             warnings.warn(
                 f"Unscaled initial probability vector supplied to setter: {np.sum(unscaled_pi)} != {1}",
                 UserWarning,
             )
+        # Read-only, so that the cached log cannot silently go stale through in-place edits
+        scaled_pi.setflags(write=False)
         self._pi = scaled_pi
+        # Cached for decoding, zero probabilities become -inf
+        self._log_pi = _log(scaled_pi)
+
+    @property
+    def log_pi(self):
+        return self._log_pi
 
 
 class TransitionProbability:
@@ -105,13 +311,10 @@ class TransitionProbability:
         the probability of transitioning from the ith element of the first argument to
         the ith element of the second argument. The elements should be state IDs, not states. 
         """
-        return np.array(
-            list(
-                map(
-                    lambda x: P_function(self.states[x[0]], self.states[x[1]]),
-                    zip(x, y),
-                )
-            )
+        return np.fromiter(
+            (P_function(self.states[i], self.states[j]) for i, j in zip(x, y)),
+            dtype=float,
+            count=len(x),
         )
 
     @property
@@ -124,11 +327,21 @@ class TransitionProbability:
 
     @P_function.setter
     def P_function(self, value):
-        states_repeated = np.repeat(self.state_ids, self.M)
-        states_tiled = np.tile(self.state_ids, self.M)
-        self.P = self.eval_to_array(value, states_repeated, states_tiled).reshape(
-            self.M, self.M
-        )
+        states_array = _as_array(self.states)
+        P = None
+        if states_array is not None:
+            # A single call on a broadcast grid of states if the supplied function is vectorized
+            P = _vectorized_eval(
+                value,
+                (self.M, self.M),
+                states_array[:, np.newaxis],
+                states_array[np.newaxis, :],
+            )
+        if P is None:
+            P = np.empty((self.M, self.M))
+            for i, j in product(self.state_ids, self.state_ids):
+                P[i, j] = value(self.states[i], self.states[j])
+        self.P = P
 
     @property
     def P(self):
@@ -137,17 +350,25 @@ class TransitionProbability:
     @P.setter
     def P(self, value):
         unscaled_P = value
-        sum_unscaled_P = np.sum(unscaled_P, axis=1)
-        scaled_P = (unscaled_P.T / sum_unscaled_P).T
-        if (
-            not np.all(np.isclose(unscaled_P, scaled_P, atol=1e-3))
-            and self.enable_warnings
+        # Row sums broadcast over the columns, no transposes or copies of the input
+        scaled_P = unscaled_P / np.sum(unscaled_P, axis=1, keepdims=True)
+        # Only compare the matrices if there is a warning to show
+        if self.enable_warnings and not np.all(
+            np.isclose(unscaled_P, scaled_P, atol=1e-3)
         ):
             warnings.warn(
                 f"Unscaled transition matrix supplied to setter: {np.sum(unscaled_P)} != {self.M}",
                 UserWarning,
             )
+        # Read-only, so that the cached log cannot silently go stale through in-place edits
+        scaled_P.setflags(write=False)
         self._P = scaled_P
+        # Cached for decoding, zero probabilities become -inf
+        self._log_P = _log(scaled_P)
+
+    @property
+    def log_P(self):
+        return self._log_P
 
 
 class EmissionProbability(EmissionProbabilityBase):
@@ -157,49 +378,94 @@ class EmissionProbability(EmissionProbabilityBase):
     ---
     emission_probability -- A function, that takes an observation as its first argument and a state as its
     second argument and returns the probability of observing the observation given that we are in the supplied state.
+    If the function is compiled with numba.njit, the emission matrix is built in parallel with numba.
     states -- A list of all the states in the state space.
+    n_jobs -- Number of threads used to build the emission matrix for functions that are neither vectorized nor compiled.
     """
 
     def __init__(
-        self, emission_probability, states, enable_warnings=False,
+        self, emission_probability, states, enable_warnings=False, n_jobs=None,
     ):
         self.states = states
         self.state_ids = np.arange(self.M).astype(int)
         self.l_function = emission_probability
         self.enable_warnings = enable_warnings
+        self.n_jobs = n_jobs
 
     def eval_to_array(self, z, x):
         """Returns an array of emission probabilities, with the ith element being 
-        the probability of observing the ith element of the first argument when in
+        the probability of observing the observation in the first argument when in
         the state identified by the state ID in the ith element of the second argument.
         """
         return np.squeeze(
-            np.array(
-                [
-                    self.l_function(observation, self.states[state_id])
-                    for observation, state_id in zip([z] * x.shape[0], x)
-                ]
-            )
+            np.array([self.l_function(z, self.states[state_id]) for state_id in x])
         )
 
     @property
     def M(self):
         return len(self.states)
 
-    def l(self, z):
+    def eval_matrix(self, z):
         """Creates a 2-dimensional array of emission probabilities for the observations at various times, for various states.
+        Tries a compiled or vectorized call before falling back to evaluating the function for each distinct observation.
         
         Parameters:
         ---
         z -- A list of observations of the type expected by the InitialProbability class.
         """
         N = len(z)
-        l_array = np.zeros((N, self.M))
-        for n in range(N):
+        # None for ragged or mixed observations or states, which skip the array paths
+        z_array = _as_array(z)
+        states_array = _as_array(self.states)
+        l_array = None
+        if z_array is not None and states_array is not None:
+            if (
+                Dispatcher is not None
+                and isinstance(self.l_function, Dispatcher)
+                and z_array.dtype.kind in "biuf"
+                and states_array.dtype.kind in "biuf"
+            ):
+                l_array = _parallel_emission_kernel(
+                    self.l_function, z_array, states_array
+                )
+            else:
+                # A single call if the supplied function broadcasts over observations and states.
+                l_array = _vectorized_eval(
+                    self.l_function,
+                    (N, self.M),
+                    z_array[:, None],
+                    states_array[None, :],
+                )
+        if l_array is None:
+            # Evaluate every distinct observation only once, which pays off for repeated observations
+            # The function is given the original observations, not the numpy scalars from np.unique
+            if z_array is not None and z_array.dtype.kind in "biufUS":
+                _, first_indices, inverse = np.unique(
+                    z_array, return_index=True, return_inverse=True
+                )
+                observations = [z[i] for i in first_indices]
+            else:
+                observations, inverse = z, None
+            K = len(observations)
+            l_array = np.empty((K, self.M))
+            if self.n_jobs is not None and self.n_jobs > 1:
+                row_chunks = np.array_split(np.arange(K), self.n_jobs)
+                with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                    list(
+                        executor.map(
+                            partial(self.fill_rows, observations, l_array), row_chunks
+                        )
+                    )
+            else:
+                self.fill_rows(observations, l_array, range(K))
+            if inverse is not None:
+                l_array = l_array[inverse.reshape(N)]
+        return l_array
+
+    def fill_rows(self, z, l_array, rows):
+        """Evaluates the emission probabilities for the observations at the given times, one row at a time."""
+        for n in rows:
             l_array[n, :] = self.eval_to_array(z[n], self.state_ids)
-        # This is a hacky solution to a problem that should probably be handled in different manner.
-        # The underlying is issue is that zero, or close to zero, values, are propogated throughout the algorithm and leads to division by zero at later stages.
-        return np.clip(l_array, a_min=1e-9, a_max=None)
 
 
 class HiddenMarkovModel:
@@ -216,6 +482,10 @@ class HiddenMarkovModel:
     enable_warnings -- Boolean. Indicates whether warnings should be displayed.
     frozen_mask -- A matrix with 0's and 1's indicating whether certain transitions should be illegal.
     Transition from state i to to state j is set to zero if (i, j) in frozen_mask is zero. 
+    n_jobs -- Number of threads. Used to build emission matrices as in EmissionProbability, and to run
+    the forward-backward passes of Baum-Welch for several observation sequences in parallel.
+    dtype -- Default floating point type of the arrays in Viterbi and forward-backward.
+    np.float32 halves the memory traffic for long sequences.
     """
 
     def __init__(
@@ -226,16 +496,23 @@ class HiddenMarkovModel:
         states,
         enable_warnings: bool = False,
         update_matrix=None,
+        n_jobs=None,
+        dtype=np.float64,
     ):
         self.states = states
         self.state_ids = np.arange(self.M).astype(int)
         self.enable_warnings: bool = enable_warnings
         self.update_matrix = update_matrix
+        self.n_jobs = n_jobs
+        self.dtype = dtype
         self.transition_probability: TransitionProbability = TransitionProbability(
             transition_probability, self.states, enable_warnings=self.enable_warnings
         )
         self.emission_probability: EmissionProbability = EmissionProbability(
-            emission_probability, self.states, enable_warnings=self.enable_warnings
+            emission_probability,
+            self.states,
+            enable_warnings=self.enable_warnings,
+            n_jobs=self.n_jobs,
         )
         self.initial_probability: InitialProbability = InitialProbability(
             initial_probability, self.states, enable_warnings=self.enable_warnings
@@ -245,6 +522,16 @@ class HiddenMarkovModel:
     def M(self):
         return len(self.states)
 
+    @property
+    def states(self):
+        return self._states
+
+    @states.setter
+    def states(self, value):
+        self._states = value
+        # Array version of the states, used by decode, if the states survive the round-trip unchanged
+        self._states_array = _as_array(value, exact=True)
+
     @property
     def pi(self):
         return self.initial_probability.pi
@@ -261,10 +548,18 @@ class HiddenMarkovModel:
     def P(self, value):
         self.transition_probability.P = value
 
+    @property
+    def log_P(self):
+        return self.transition_probability.log_P
+
+    @property
+    def log_pi(self):
+        return self.initial_probability.log_pi
+
     def l(self, z):
         return self.emission_probability.l(z)
 
-    def viterbi(self, z):
+    def viterbi(self, z, dtype=None):
         """Run Viterbi in order to obtain the state sequence that maximizes the posterior probability.
         In other words, the argmax of the probability of a state sequence conditioned the observed sequence.
         A wrapper around the internals.
@@ -272,11 +567,14 @@ class HiddenMarkovModel:
         Parameters:
         ---
         z -- List of observations.
+        dtype -- Floating point type of the arrays used in the recursion. Defaults to the dtype of the model.
         """
-        return self.log_viterbi_internals(z, self.P, self.l(z), self.pi)
+        dtype = self.dtype if dtype is None else dtype
+        # The logs of P and pi are cached when they are set
+        return self._log_viterbi(self.log_P, _log(self.l(z)), self.log_pi, dtype=dtype)
 
     @staticmethod
-    def viterbi_internals(z, P, l, pi):
+    def viterbi_internals(z, P, l, pi, dtype=np.float64):
         """Simple, self-contained, straight-forward implementation of Viterbi. 
         Should probably not be used, use log_viterbi_internals instead.
         
@@ -286,34 +584,35 @@ class HiddenMarkovModel:
         P -- The transition matrix.
         pi -- The initial probabilities.
         l -- The emission probabilities.
+        dtype -- Floating point type of the arrays used in the recursion.
         """
         N = len(z)
         assert pi.shape[0] == l.shape[1]
         M = pi.shape[0]
+        P, l, pi = (np.asarray(x, dtype=dtype) for x in (P, l, pi))
 
-        delta = np.zeros((N, M))
-        phi = np.zeros((N, M))
+        delta = np.empty((N, M), dtype=dtype)
+        # Smallest integer type that holds a state ID, uint8 for up to 256 states
+        phi = np.empty((N, M), dtype=np.min_scalar_type(M - 1))
+        columns = np.arange(M)
 
         delta[0, :] = pi * l[0, :]
         phi[0, :] = 0
 
         for n in np.arange(1, N):
             # Multiply delta by each column in P
-            # In resulting matrix, for each column, find max entry
-            delta[n, :] = l[n, :] * np.max((delta[n - 1, :] * P.T).T, axis=0)
-            phi[n, :] = np.argmax((delta[n - 1, :] * P.T).T, axis=0)
-
-        x_star = np.zeros((N,))
-        x_star[N - 1] = np.argmax(delta[N - 1, :])
-
-        for n in np.arange(N - 2, -1, -1):
-            x_star[n] = phi[n + 1, x_star[n + 1].astype(int)]
+            # In resulting matrix, for each column, find argmax and reuse it to pick the max
+            scores = P * delta[n - 1, :][:, np.newaxis]
+            phi_n = np.argmax(scores, axis=0)
+            delta[n, :] = l[n, :] * scores[phi_n, columns]
+            phi[n, :] = phi_n
 
-        return x_star.astype(int)
+        return HiddenMarkovModel._backtrack(phi, np.argmax(delta[N - 1, :]))
 
     @staticmethod
-    def log_viterbi_internals(z, P, l, pi):
+    def log_viterbi_internals(z, P, l, pi, dtype=np.float64):
         """Viterbi in log-space. More stable, i.e. resistant to almost-zero values, than the regular implementation.
+        Being in log-space, the recursion is also well suited for np.float32.
         
         Parameters:
         ---
@@ -321,36 +620,131 @@ class HiddenMarkovModel:
         P -- The transition matrix.
         pi -- The initial probabilities.
         l -- The emission probabilities.
+        dtype -- Floating point type of the arrays used in the recursion.
         """
-        N = len(z)
+        assert len(z) == l.shape[0]
         assert pi.shape[0] == l.shape[1]
-        M = pi.shape[0]
+        P, l, pi = (np.asarray(x, dtype=dtype) for x in (P, l, pi))
+
+        # Zero probabilities become -inf
+        log_P, log_l, log_pi = _log(P), _log(l), _log(pi)
+
+        return HiddenMarkovModel._log_viterbi(log_P, log_l, log_pi, dtype=dtype)
+
+    @staticmethod
+    def _log_viterbi(log_P, log_l, log_pi, dtype=np.float64):
+        """The recursion of log_viterbi_internals, for when the logs of P, l and pi are at hand."""
+        N, M = log_l.shape
+        log_P, log_l, log_pi = (
+            np.asarray(x, dtype=dtype) for x in (log_P, log_l, log_pi)
+        )
+
+        if _log_viterbi_kernel is not None:
+            return _log_viterbi_kernel(
+                np.ascontiguousarray(log_P),
+                np.ascontiguousarray(log_l),
+                np.ascontiguousarray(log_pi),
+                np.empty((N, M), dtype=np.min_scalar_type(M - 1)),
+            )
 
-        delta = np.zeros((N, M))
-        phi = np.zeros((N, M))
-        log_P = ma.log(P).filled(-np.inf)
+        delta = np.empty((N, M), dtype=dtype)
+        # Smallest integer type that holds a state ID, uint8 for up to 256 states
+        phi = np.empty((N, M), dtype=np.min_scalar_type(M - 1))
 
-        delta[0, :] = ma.log(pi).filled(-np.inf) + ma.log(l[0, :]).filled(-np.inf)
+        delta[0, :] = log_pi + log_l[0, :]
         phi[0, :] = 0
 
         for n in np.arange(1, N):
-            # Multiply delta by each column in P
-            # In resulting matrix, for each column, find max entry
-            log_l = ma.log(l[n, :]).filled(-np.inf)
-            delta[n, :] = log_l + np.max(
-                (np.expand_dims(delta[n - 1, :], axis=1) + log_P), axis=0
-            )
-            phi[n, :] = np.argmax(
-                (np.expand_dims(delta[n - 1, :], axis=1) + log_P), axis=0
+            max_scores, phi[n, :] = HiddenMarkovModel._argmaxplus(
+                delta[n - 1, :], log_P
             )
+            delta[n, :] = log_l[n, :] + max_scores
 
-        q_star = np.zeros((N,))
-        q_star[N - 1] = np.argmax(delta[N - 1, :])
+        return HiddenMarkovModel._backtrack(phi, np.argmax(delta[N - 1, :]))
 
-        for n in np.arange(N - 2, -1, -1):
-            q_star[n] = phi[n + 1, q_star[n + 1].astype(int)]
+    @staticmethod
+    def parallel_log_viterbi_internals(z, P, l, pi, dtype=np.float64, block_size=None):
+        """Viterbi in log-space, with the recursion computed as an associative scan.
+        Each step of the recursion is a max-plus product with the matrix log P + log l[n], and max-plus
+        products are associative, so all prefix products are found in log2(N) vectorized passes instead of N steps.
+        This costs O(N M^3 log N) operations and O(N M^2) memory for the scanned matrices, so it only pays off
+        for long sequences and few states. Each max-plus product of a block of B matrices needs a temporary of B M^3 elements.
+
+        Parameters:
+        ---
+        z -- List of observations.
+        P -- The transition matrix.
+        pi -- The initial probabilities.
+        l -- The emission probabilities.
+        dtype -- Floating point type of the arrays used in the recursion.
+        block_size -- Number of matrices combined per vectorized max-plus product.
+        Defaults to a block whose temporary holds about four million elements.
+        """
+        N = len(z)
+        assert pi.shape[0] == l.shape[1]
+        M = pi.shape[0]
+        P, l, pi = (np.asarray(x, dtype=dtype) for x in (P, l, pi))
+        if block_size is None:
+            block_size = max(1, 2**22 // M**3)
+
+        # Zero probabilities become -inf
+        log_P, log_l, log_pi = _log(P), _log(l), _log(pi)
+
+        delta = np.empty((N, M), dtype=dtype)
+        delta[0, :] = log_pi + log_l[0, :]
+
+        # Inclusive scan over the transition matrices of each step, doubling the span in every pass
+        scan = log_P[np.newaxis, :, :] + log_l[1:, np.newaxis, :]
+        span = 1
+        while span < N - 1:
+            # Blocks from the back, so that the left operands, span steps earlier, are still from the previous pass
+            for stop in range(N - 1, span, -block_size):
+                start = max(span, stop - block_size)
+                scan[start:stop] = HiddenMarkovModel._maxplus_matmul(
+                    scan[start - span : stop - span], scan[start:stop]
+                )
+            span *= 2
+        delta[1:, :] = np.max(delta[0, :, np.newaxis] + scan, axis=1)
+
+        # All back-pointers at once, now that every delta is known
+        # Smallest integer type that holds a state ID, uint8 for up to 256 states
+        phi = np.empty((N, M), dtype=np.min_scalar_type(M - 1))
+        phi[0, :] = 0
+        phi[1:, :] = np.argmax(delta[:-1, :, np.newaxis] + log_P, axis=1)
+
+        return HiddenMarkovModel._backtrack(phi, np.argmax(delta[N - 1, :]))
+
+    @staticmethod
+    def _maxplus_matmul(A, B):
+        """Max-plus product of stacks of matrices, the max-plus analogue of np.matmul."""
+        return np.max(A[..., :, :, np.newaxis] + B[..., np.newaxis, :, :], axis=-2)
+
+    @staticmethod
+    def _backtrack(phi, last):
+        """Follows the back-pointers in phi, starting from the last state ID of the best path.
+        Returns the state IDs of the path as int32.
+        """
+        if _backtrack_kernel is not None:
+            return _backtrack_kernel(phi, last)
 
-        return q_star.astype(int)
+        N = phi.shape[0]
+        q_star = np.empty((N,), dtype=np.int32)
+        q_star[N - 1] = last
+        for n in range(N - 2, -1, -1):
+            q_star[n] = phi[n + 1, q_star[n + 1]]
+
+        return q_star
+
+    @staticmethod
+    def _argmaxplus(delta, log_P):
+        """Max-plus product of delta and log P, along with its arguments, in a single pass.
+        Returns, for each column of log P, the max of delta plus the column, and the row that attains it.
+        """
+        # Add delta to each column in log P
+        # In resulting matrix, for each column, find argmax and reuse it to pick the max
+        scores = delta[:, np.newaxis] + log_P
+        arg_max = np.argmax(scores, axis=0)
+        return scores[arg_max, np.arange(log_P.shape[1])], arg_max
 
     def decode(self, z):
         """The Viterbi method returns an array of state ids.
@@ -361,16 +755,31 @@ class HiddenMarkovModel:
         z -- List of observations.
         """
         state_ids = self.viterbi(z)
+        if self._states_array is not None:
+            return self._states_array[state_ids].tolist()
         return list(map(lambda x: self.states[x], state_ids))
 
-    def forward_algorithm(self, z):
-        """Run the forward algorithm with object-specific arguments to the internals."""
+    def forward_algorithm(self, z, dtype=None):
+        """Run the forward algorithm with object-specific arguments to the internals.
+        The emission probabilities are kept, so that the backward algorithm can reuse them.
+        """
+        dtype = self.dtype if dtype is None else dtype
+        self.l_array = self.l(z)
         self.c, self.alpha = self.forward_algorithm_internals(
-            z, self.P, self.l(z), self.pi
+            z, self.P, self.l_array, self.pi, dtype=dtype
         )
+        self.log_probability = self.scalings_log_probability(self.c)
 
     @staticmethod
-    def forward_algorithm_internals(z, P, l, pi):
+    def scalings_log_probability(c):
+        """The log-probability of an observation sequence, given the scalings c from the forward algorithm.
+        Each scaling is the reciprocal of the probability of one observation given the ones before it.
+        Summed in double precision, also when the scalings are np.float32.
+        """
+        return -np.sum(np.log(c), dtype=np.float64)
+
+    @staticmethod
+    def forward_algorithm_internals(z, P, l, pi, dtype=np.float64):
         """The actual implementation of the forward-algorithm. Returns scalings and alpha. 
         Scaling is needed to avoid numerical errors for longer observation sequences. 
         See Rabiner's "Fundamentals of Speech Processing" or similar resource.
@@ -381,41 +790,89 @@ class HiddenMarkovModel:
         P -- The transition matrix.
         pi -- The initial probabilities.
         l -- The emission probabilities.
+        dtype -- Floating point type of alpha and the scalings. The per-step scaling keeps np.float32 in range.
         """
         N = len(z)
         assert pi.shape[0] == l.shape[1]
         M = pi.shape[0]
+        P, l, pi = (np.asarray(x, dtype=dtype) for x in (P, l, pi))
+
+        alpha = np.empty((N, M), dtype=dtype)
+        c = np.empty((N,), dtype=dtype)
+        # Transpose of a Fortran-ordered copy is C-contiguous, so that each step is a single matrix-vector product
+        P_T = np.asfortranarray(P).T
 
-        alpha = np.zeros((N, M))
-        c = np.zeros((N,))
+        if _forward_kernel is not None:
+            _forward_kernel(P_T, np.ascontiguousarray(l), pi, alpha, c)
+            return c, alpha
 
-        alpha[0, :] = l[0, :] * pi
-        c[0] = np.reciprocal(np.sum(alpha[0, :]))
-        alpha[0, :] = alpha[0, :] * c[0]
+        np.multiply(l[0, :], pi, out=alpha[0, :])
+        c[0] = 1.0 / alpha[0, :].sum()
+        alpha[0, :] *= c[0]
 
+        # Every step writes straight into the preallocated rows of alpha
         for n in np.arange(N - 1):
-            alpha[n + 1, :] = np.sum(alpha[n, :][:, np.newaxis] * P, axis=0) * (
-                l[n + 1, :]
-            )
-            c[n + 1] = np.reciprocal(np.sum(alpha[n + 1, :]))
-            alpha[n + 1, :] = alpha[n + 1, :] * c[n + 1]
+            np.matmul(P_T, alpha[n, :], out=alpha[n + 1, :])
+            np.multiply(alpha[n + 1, :], l[n + 1, :], out=alpha[n + 1, :])
+            c[n + 1] = 1.0 / alpha[n + 1, :].sum()
+            alpha[n + 1, :] *= c[n + 1]
 
         return c, alpha
 
-    def backward_algorithm(self, z):
+    def log_forward_algorithm(self, z):
+        """Run the forward algorithm in log-space with object-specific arguments to the internals."""
+        self.log_alpha = self.log_forward_algorithm_internals(
+            z, self.P, self.l(z), self.pi
+        )
+
+    @staticmethod
+    def log_forward_algorithm_internals(z, P, l, pi):
+        """The forward algorithm in log-space. Returns log alpha, the unscaled log-probabilities
+        of the observations up to each time and being in each state. Needs no scaling, and
+        the log-probability of the whole sequence is the log-sum-exp of the final row.
+
+        Parameters:
+        ---
+        z -- List of observations.
+        P -- The transition matrix.
+        pi -- The initial probabilities.
+        l -- The emission probabilities.
+        """
+        N = len(z)
+        assert pi.shape[0] == l.shape[1]
+        M = pi.shape[0]
+
+        # Zero probabilities become -inf
+        log_P, log_l, log_pi = _log(P), _log(l), _log(pi)
+
+        log_alpha = np.empty((N, M))
+        log_alpha[0, :] = log_pi + log_l[0, :]
+
+        for n in np.arange(N - 1):
+            with np.errstate(divide="ignore"):
+                log_alpha[n + 1, :] = (
+                    logsumexp(log_alpha[n, :][:, np.newaxis] + log_P, axis=0)
+                    + log_l[n + 1, :]
+                )
+
+        return log_alpha
+
+    def backward_algorithm(self, z, dtype=None):
         """Wrapper around the backward algorithm, calling the internals with object-specific attributes.
         
         Parameters:
         ---
         z -- List of observations.
+        dtype -- Floating point type of beta. Defaults to the dtype of the model.
         """
+        dtype = self.dtype if dtype is None else dtype
         assert hasattr(self, "c"), "Run forward algorithm first!"
         self.beta = self.backward_algorithm_internals(
-            z, self.P, self.l(z), self.pi, self.c
+            z, self.P, self.l_array, self.pi, self.c, dtype=dtype
         )
 
     @staticmethod
-    def backward_algorithm_internals(z, P, l, pi, c):
+    def backward_algorithm_internals(z, P, l, pi, c, dtype=np.float64):
         """The actual implementation of the backward-algorithm. Returns beta, an array.
         See Rabiner's "Fundamentals of Speech Processing" or similar resource.
 
@@ -425,18 +882,27 @@ class HiddenMarkovModel:
         P -- The transition matrix.
         l -- The emission probabilities.
         pi -- The initial probabilities.
+        dtype -- Floating point type of beta.
         """
         N = len(z)
         assert pi.shape[0] == l.shape[1]
         M = pi.shape[0]
+        P, l, c = (np.asarray(x, dtype=dtype) for x in (P, l, c))
+
+        beta = np.empty((N, M), dtype=dtype)
+
+        if _backward_kernel is not None:
+            _backward_kernel(np.ascontiguousarray(P), np.ascontiguousarray(l), c, beta)
+            return beta
 
-        beta = np.zeros((N, M))
         beta[N - 1, :] = 1 * c[N - 1]
+        # Reused for the product of emissions and beta, so that no step allocates
+        b_beta = np.empty((M,), dtype=dtype)
 
         for n in np.arange(N - 2, -1, -1):
-            b = l[n + 1, :]
-
-            beta[n, :] = np.sum(P * b * beta[n + 1, :], axis=1) * c[n]
+            np.multiply(l[n + 1, :], beta[n + 1, :], out=b_beta)
+            np.dot(P, b_beta, out=beta[n, :])
+            beta[n, :] *= c[n]
 
         return beta
 
@@ -448,11 +914,56 @@ class HiddenMarkovModel:
         ---
         z -- List of observations.
         """
-        self.forward_algorithm(z)
-        self.backward_algorithm(z)
+        # Emission probabilities are evaluated once and shared by all the passes
+        self.l_array = self.l(z)
+        self.c, self.alpha = self.forward_algorithm_internals(
+            z, self.P, self.l_array, self.pi, dtype=self.dtype
+        )
+        self.log_probability = self.scalings_log_probability(self.c)
+        self.beta = self.backward_algorithm_internals(
+            z, self.P, self.l_array, self.pi, self.c, dtype=self.dtype
+        )
 
         self.gamma = self.calculate_gamma(self.alpha, self.beta)
-        self.ksi = self.calculate_ksi(z, self.P, self.l(z), self.alpha, self.beta)
+        self.ksi = self.calculate_ksi(z, self.P, self.l_array, self.alpha, self.beta)
+
+    def expectation_step(self, z, l=None):
+        """Runs forward-backward for a single observation sequence without storing anything on the object,
+        so that several sequences can be processed in parallel. Returns gamma, ksi and the log-probability of the sequence.
+
+        Parameters:
+        ---
+        z -- List of observations.
+        l -- The emission probabilities of z, if already evaluated.
+        """
+        if l is None:
+            l = self.l(z)
+        c, alpha = self.forward_algorithm_internals(
+            z, self.P, l, self.pi, dtype=self.dtype
+        )
+        beta = self.backward_algorithm_internals(
+            z, self.P, l, self.pi, c, dtype=self.dtype
+        )
+        gamma = self.calculate_gamma(alpha, beta)
+        ksi = self.calculate_ksi(z, self.P, l, alpha, beta)
+        return gamma, ksi, self.scalings_log_probability(c)
+
+    def expectation_steps(self, zs):
+        """Runs the expectation step for each of the observation sequences, in parallel if n_jobs is above one.
+        Yields the results in the same order as the sequences.
+
+        Parameters:
+        ---
+        zs -- A list of observation sequences.
+        """
+        if self.n_jobs is not None and self.n_jobs > 1 and len(zs) > 1:
+            # Emission probabilities are evaluated on this thread, since compiled emission functions
+            # run in numba's own parallel threading layer, which must not be entered from several threads at once
+            ls = [self.l(z) for z in zs]
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                yield from executor.map(self.expectation_step, zs, ls)
+        else:
+            yield from map(self.expectation_step, zs)
 
     @staticmethod
     def calculate_ksi(z, P, l, alpha, beta):
@@ -470,11 +981,14 @@ class HiddenMarkovModel:
         assert l.shape[1] == alpha.shape[1] == beta.shape[1]
         M = alpha.shape[1]
 
-        ksi = np.zeros((N - 1, M, M))
-        for n in range(N - 1):
-            b = l[n + 1, :]
-            ksi[n, :, :] = (P * b * beta[n + 1, :]) * alpha[n, :][:, np.newaxis]
-            ksi[n, :, :] = ksi[n, :, :] / np.sum(ksi[n, :, :])
+        # Same floating point type as alpha and beta
+        ksi = np.empty((N - 1, M, M), dtype=alpha.dtype)
+        P, l = (np.asarray(x, dtype=ksi.dtype) for x in (P, l))
+        # Emission probabilities times beta for the "to" state, for all times at once
+        b_beta = l[1:, :] * beta[1:, :]
+        # Time on first axis, from state on second, to state on third, written directly into ksi
+        np.einsum("ni,ij,nj->nij", alpha[:-1, :], P, b_beta, out=ksi)
+        ksi /= np.sum(ksi, axis=(1, 2), keepdims=True)
 
         return ksi
 
@@ -496,6 +1010,9 @@ class HiddenMarkovModel:
 
     def baum_welch(self, zs):
         """Baum-Welch algorithm. Expectation-maximization. Updates the parameters to increase the expected log-probability of the observation sequence(s).
+        Returns the mean log-probability of the observation sequences under the parameters prior to the update,
+        which falls out of the forward passes.
+        Unlike forward_backward_algorithm, this does not store alpha, beta, c, gamma or ksi on the object.
 
         Parameters:
         ---
@@ -506,22 +1023,24 @@ class HiddenMarkovModel:
         pis_sum = np.zeros((self.M,))
 
         # Compute the log-probability for each of the observation sequences.
+        log_probabilities_sum = 0.0
+
         E = len(zs)
-        for z in zs:
-            self.forward_backward_algorithm(z)
+        for z, (gamma, ksi, log_probability) in zip(zs, self.expectation_steps(zs)):
+            log_probabilities_sum += log_probability
             (
                 P_numerator,
                 P_denominator,
-            ) = self.calculate_inner_transition_probability_sums(self.ksi, self.gamma)
+            ) = self.calculate_inner_transition_probability_sums(ksi, gamma)
             P_numerators_sum += P_numerator
             P_denominators_sum += P_denominator
-            pi = self.gamma[0, :]
+            pi = gamma[0, :]
             pis_sum += pi
 
         if self.update_matrix is not None:
             previous_P = self.P
             new_P = P_numerators_sum / P_denominators_sum[:, np.newaxis]
-            P = previous_P
+            P = previous_P.copy()
             indices_to_update = self.update_matrix.nonzero()
             row_indices, column_indices = indices_to_update
             P[row_indices, column_indices] = new_P[row_indices, column_indices]
@@ -530,6 +1049,8 @@ class HiddenMarkovModel:
         self.P = P
         self.pi = pis_sum / E
 
+        return log_probabilities_sum / E
+
     @staticmethod
     def calculate_inner_transition_probability_sums(ksi, gamma):
         """Computing the sums required for the updated transition probabiltites.
@@ -546,7 +1067,7 @@ class HiddenMarkovModel:
     def observation_log_probability(self, z):
         """Run forward algorithm to compute log probability of observation."""
         self.forward_algorithm(z)
-        return -np.sum(np.log(self.c))
+        return self.log_probability
 
     def reestimation(self, zs, n):
         """Run Baum-Welch for a specified number of iterations.
@@ -563,22 +1084,20 @@ class HiddenMarkovModel:
                 'Class must implement some form of the Baum-Welch algorithm. The method must be named "baum_welch".'
             )
         history = []
-        initial_log_probability = np.mean(
-            list(map(self.observation_log_probability, zs))
-        )
-        history.append(initial_log_probability)
         print(f"Running {n} iterations of Baum-Welch")
         for _ in trange(n):
-            self.baum_welch(zs)
-            current_log_probability: float = np.mean(
-                list(map(self.observation_log_probability, zs))
-            )
-            history.append(current_log_probability)
+            # The log-probability prior to each update comes from the forward passes of Baum-Welch itself
+            previous_log_probability: float = self.baum_welch(zs)
+            history.append(previous_log_probability)
+        current_log_probability: float = np.mean(
+            list(map(self.observation_log_probability, zs))
+        )
+        history.append(current_log_probability)
 
         return np.array(history)
 
 
-class DiscreteEmissionProbability:
+class DiscreteEmissionProbability(EmissionProbabilityBase):
     """Class for representing probabilities for discrete observations.
     The initial argument should be a function that takes two arguments and returns the probability of
     the symbol given in the first argument when in the state given by the second argument.
@@ -603,13 +1122,13 @@ class DiscreteEmissionProbability:
         # Surely this can be avoided
         self.symbol_id_dictionary = {k: v for k, v in zip(self.symbols, range(self.K))}
         self.l_function = emission_probability
-        b = np.array(
-            list(
-                map(
-                    lambda x: self.l_function(x[0], x[1]),
-                    product(self.symbols, self.states),
-                )
-            )
+        b = np.fromiter(
+            (
+                self.l_function(symbol, state)
+                for symbol, state in product(self.symbols, self.states)
+            ),
+            dtype=float,
+            count=self.K * self.M,
         ).reshape(self.K, self.M)
         self.b = b
 
@@ -628,39 +1147,35 @@ class DiscreteEmissionProbability:
     @b.setter
     def b(self, value):
         unscaled_b = value
-        scaled_b = value / np.sum(unscaled_b, axis=0)
-        if (
-            not np.all(np.isclose(unscaled_b, scaled_b, atol=1e-3))
-            and self.enable_warnings
+        scaled_b = unscaled_b / np.sum(unscaled_b, axis=0, keepdims=True)
+        # Only compare the matrices if there is a warning to show
+        if self.enable_warnings and not np.all(
+            np.isclose(unscaled_b, scaled_b, atol=1e-3)
         ):
             warnings.warn("Unscaled emission matrix supplied to setter.", UserWarning)
         self._b = scaled_b
 
     def eval_to_array(self, z, x):
         """Return an array where the ith element is the probability of observing the symbol in
-        the ith positon of the first argument when in state identified by the state ID in the ith
+        the first argument when in state identified by the state ID in the ith
         positon of the second argument."""
-        return np.array(
-            [
-                self.b[self.symbol_id_dictionary[a], b]
-                for a, b in zip([z] * x.shape[0], x)
-            ]
-        )
+        return self.b[self.symbol_id_dictionary[z], x]
 
-    def l(self, z):
+    def symbol_ids(self, z):
+        """Returns an array with the symbol ID of each observation in z.
+        The symbol ID is the index of the symbol in the list passed in the constructor.
+        """
+        return _symbol_ids(z, self.symbol_id_dictionary)
+
+    def eval_matrix(self, z):
         """Creates a 2-dimensional array of emission probabilities for the observations at various times, for various states.
         
         Parameters:
         ---
-        z -- A list of observations of the type expected by the InitialProbability class.
+        z -- A list of observations, each being one of the symbols.
         """
-        N = len(z)
-        l_array = np.zeros((N, self.M))
-        for n in range(N):
-            l_array[n, :] = self.eval_to_array(z[n], self.state_ids)
-        # This is a hacky solution to a problem that should probably be handled in different manner.
-        # The underlying is issue is that zero, or close to zero, values, are propogated throughout the algorithm and leads to division by zero at later stages.
-        return np.clip(l_array, a_min=1e-9, a_max=None)
+        # The rows of b for the observed symbols, gathered in one go
+        return self.b[self.symbol_ids(z), :]
 
 
 class DiscreteHiddenMarkovModel(HiddenMarkovModel):
@@ -680,6 +1195,8 @@ class DiscreteHiddenMarkovModel(HiddenMarkovModel):
         symbols,
         enable_warnings=False,
         update_matrix=None,
+        n_jobs=None,
+        dtype=np.float64,
     ):
         self.states = states
         self.state_ids = np.arange(self.M).astype(int)
@@ -687,6 +1204,8 @@ class DiscreteHiddenMarkovModel(HiddenMarkovModel):
 
         self.update_matrix = update_matrix
         self.enable_warnings: bool = enable_warnings
+        self.n_jobs = n_jobs
+        self.dtype = dtype
 
         self.transition_probability: TransitionProbability = TransitionProbability(
             transition_probability, self.states, enable_warnings=self.enable_warnings,
@@ -711,6 +1230,8 @@ class DiscreteHiddenMarkovModel(HiddenMarkovModel):
 
     def baum_welch(self, zs):
         """Baum-Welch for discrete observations.
+        Returns the mean log-probability of the observation sequences prior to the update.
+        Unlike forward_backward_algorithm, this does not store alpha, beta, c, gamma or ksi on the object.
         
         Parameters:
         ---
@@ -722,29 +1243,31 @@ class DiscreteHiddenMarkovModel(HiddenMarkovModel):
         b_denominators_sum = np.zeros((self.M,))
         pis_sum = np.zeros((self.M,))
 
+        log_probabilities_sum = 0.0
+
         E = len(zs)
-        for z in zs:
-            self.forward_backward_algorithm(z)
+        for z, (gamma, ksi, log_probability) in zip(zs, self.expectation_steps(zs)):
+            log_probabilities_sum += log_probability
             (
                 P_numerator,
                 P_denominator,
-            ) = self.calculate_inner_transition_probability_sums(self.ksi, self.gamma)
+            ) = self.calculate_inner_transition_probability_sums(ksi, gamma)
             P_numerators_sum += P_numerator
             P_denominators_sum += P_denominator
 
             b_numerator, b_denominator = self.calculate_inner_emission_probability_sums(
-                z, self.gamma, self.symbols
+                z, gamma, self.symbols
             )
             b_numerators_sum += b_numerator
             b_denominators_sum += b_denominator
 
-            pi = self.gamma[0, :]
+            pi = gamma[0, :]
             pis_sum += pi
 
         if self.update_matrix is not None:
             previous_P = self.P
             new_P = P_numerators_sum / P_denominators_sum[:, np.newaxis]
-            P = previous_P
+            P = previous_P.copy()
             indices_to_update = self.update_matrix.nonzero()
             row_indices, column_indices = indices_to_update
             P[row_indices, column_indices] = new_P[row_indices, column_indices]
@@ -755,6 +1278,8 @@ class DiscreteHiddenMarkovModel(HiddenMarkovModel):
         self.b = b_numerators_sum / b_denominators_sum
         self.pi = pis_sum / E
 
+        return log_probabilities_sum / E
+
     @staticmethod
     def calculate_inner_emission_probability_sums(z, gamma, symbols):
         """Calculates sum in update equations for emission probabilties.
@@ -765,23 +1290,21 @@ class DiscreteHiddenMarkovModel(HiddenMarkovModel):
         gamma -- A 2-dimensional array containing all values for gamma. Time index on first axis, state index on second. 
         symbols -- A list of all symbols.
         """
-        M = gamma.shape[1]
+        N, M = gamma.shape
         K = len(symbols)
-        numerator_sum = np.ones((K, M))
-        for k, o in enumerate(symbols):
-            # Indices where observation equals symbol k
-            z_is_k = np.array(list(map(lambda x: x == o, z))).astype(int)
-            # All zeros
-            partial_gamma = gamma * z_is_k[:, np.newaxis]
-            # Assign non-zero values to rows (times) where observation equals symbol k
-            # Sum over all time-steps
-            numerator_sum[k, :] = np.sum(partial_gamma, axis=0)
+        z_ids = _symbol_ids(z, {symbol: k for k, symbol in enumerate(symbols)})
+        # Scatter-add gamma at time t into the row of the symbol observed at time t, all in one pass
+        # The flat bin of (symbol k, state m) is k * M + m
+        bins = (z_ids[:, np.newaxis] * M + np.arange(M)).ravel()
+        numerator_sum = np.bincount(
+            bins, weights=gamma.ravel(), minlength=K * M
+        ).reshape(K, M)
         denominator_sum = np.sum(gamma, axis=0)
 
         return numerator_sum, denominator_sum
 
 
-class GaussianEmissionProbability:
+class GaussianEmissionProbability(EmissionProbabilityBase):
     """Class for representing state-dependent Gaussian emission probabilties."""
 
     def __init__(self, mu, sigma):
@@ -797,23 +1320,37 @@ class GaussianEmissionProbability:
         self.l_function = emission_probability
 
     def eval_to_array(self, z, x):
-        # Can do apply along axis.
-        return np.array([self.l_function(z, x) for z, x in zip([z] * x.shape[0], x)])
+        return np.array([self.l_function(z, state_id) for state_id in x])
 
-    def l(self, z):
+    def eval_matrix(self, z):
         """Creates a 2-dimensional array of emission probabilities for the observations at various times, for various states.
         
         Parameters:
         ---
-        z -- A list of observations of the type expected by the InitialProbability class.
+        z -- A list of observations, each of dimension D.
+        """
+        return np.exp(self.log_pdf_batch(z))
+
+    def log_pdf_batch(self, z):
+        """Creates a 2-dimensional array of Gaussian log-densities for the observations at various times, for various states.
+        Factors the covariances once per call, with one triangular solve per state for the whole sequence.
+
+        Parameters:
+        ---
+        z -- A list of observations, each of dimension D.
         """
         N = len(z)
-        l_array = np.zeros((N, self.M))
-        for n in range(N):
-            l_array[n, :] = self.eval_to_array(z[n], self.state_ids)
-        # This is a hacky solution to a problem that should probably be handled in different manner.
-        # The underlying is issue is that zero, or close to zero, values, are propogated throughout the algorithm and leads to division by zero at later stages.
-        return np.clip(l_array, a_min=1e-9, a_max=None)
+        z_array = np.asarray(z, dtype=float).reshape(N, -1)
+        D = z_array.shape[1]
+        cholesky, log_determinants = self.cholesky
+        log_l_array = np.empty((N, self.M))
+        for m in self.state_ids:
+            difference = z_array - self.mu[m, :]
+            y = solve_triangular(cholesky[m], difference.T, lower=True)
+            log_l_array[:, m] = -0.5 * (
+                D * np.log(2 * np.pi) + log_determinants[m] + np.sum(y * y, axis=0)
+            )
+        return log_l_array
 
     @property
     def M(self):
@@ -835,6 +1372,18 @@ class GaussianEmissionProbability:
     def sigma(self, value):
         self._sigma = value
 
+    @property
+    def cholesky(self):
+        """Lower Cholesky factors of the covariances and the log-determinants of the covariances.
+        Not cached, so that in-place edits of sigma are always seen. Factoring costs O(M D^3),
+        little next to the O(N M D^2) of evaluating the densities.
+        """
+        cholesky = np.linalg.cholesky(self.sigma)
+        log_determinants = 2 * np.sum(
+            np.log(np.diagonal(cholesky, axis1=1, axis2=2)), axis=1
+        )
+        return cholesky, log_determinants
+
 
 class GaussianHiddenMarkovModel(HiddenMarkovModel):
     """Class for representing Hidden Markov Models where the state dependency is expressed entirely through
@@ -848,6 +1397,8 @@ class GaussianHiddenMarkovModel(HiddenMarkovModel):
     mu -- An array with shape (M, D), where M is the cardinality of the state space and D is the dimension of
     the observations. Each row is the initial mean for the M different states. 
     sigma  -- An array with shape (M, D, D), where the mth slice along the first axis is the initial covariance matrix.    
+    n_jobs -- Number of threads used to run the forward-backward passes of Baum-Welch for several sequences in parallel.
+    dtype -- As in HiddenMarkovModel.
     """
 
     def __init__(
@@ -859,11 +1410,15 @@ class GaussianHiddenMarkovModel(HiddenMarkovModel):
         sigma: list,
         enable_warnings: bool = False,
         update_matrix=None,
+        n_jobs=None,
+        dtype=np.float64,
     ):
         self.states = states
         self.state_ids = np.arange(self.M).astype(int)
         self.enable_warnings: bool = enable_warnings
         self.update_matrix = update_matrix
+        self.n_jobs = n_jobs
+        self.dtype = dtype
         self.transition_probability: TransitionProbability = TransitionProbability(
             transition_probability, self.states, enable_warnings=self.enable_warnings
         )
@@ -892,6 +1447,8 @@ class GaussianHiddenMarkovModel(HiddenMarkovModel):
 
     def baum_welch(self, zs: list):
         """Baum-Welch for hidden Markov model with Gaussian emissions.
+        Returns the mean log-probability of the observation sequences prior to the update.
+        Unlike forward_backward_algorithm, this does not store alpha, beta, c, gamma or ksi on the object.
 
         Parameters:
         ---
@@ -908,24 +1465,26 @@ class GaussianHiddenMarkovModel(HiddenMarkovModel):
         sigma_numerators_sum = np.zeros((self.M, D, D))
         sigma_denominators_sum = np.zeros((self.M,))
 
+        log_probabilities_sum = 0.0
+
         E = len(zs)
-        for z in zs:
-            self.forward_backward_algorithm(z)
+        for z, (gamma, ksi, log_probability) in zip(zs, self.expectation_steps(zs)):
+            log_probabilities_sum += log_probability
             (
                 P_numerator,
                 P_denominator,
-            ) = self.calculate_inner_transition_probability_sums(self.ksi, self.gamma)
+            ) = self.calculate_inner_transition_probability_sums(ksi, gamma)
             P_numerators_sum += P_numerator
             P_denominators_sum += P_denominator
-            pi = self.gamma[0, :]
+            pi = gamma[0, :]
             pis_sum += pi
 
-            mu_numerator, mu_denominator = self.calculate_mu(z, self.gamma)
+            mu_numerator, mu_denominator = self.calculate_mu(z, gamma)
             mu_numerators_sum += mu_numerator
             mu_denominators_sum += mu_denominator
 
             sigma_numerator, sigma_denominator = self.calculate_sigma(
-                z, self.emission_probability.mu, self.gamma
+                z, self.emission_probability.mu, gamma
             )
             sigma_numerators_sum += sigma_numerator
             sigma_denominators_sum += sigma_denominator
@@ -933,7 +1492,7 @@ class GaussianHiddenMarkovModel(HiddenMarkovModel):
         if self.update_matrix is not None:
             previous_P = self.P
             new_P = P_numerators_sum / P_denominators_sum[:, np.newaxis]
-            P = previous_P
+            P = previous_P.copy()
             indices_to_update = self.update_matrix.nonzero()
             row_indices, column_indices = indices_to_update
             P[row_indices, column_indices] = new_P[row_indices, column_indices]
@@ -949,6 +1508,8 @@ class GaussianHiddenMarkovModel(HiddenMarkovModel):
         )
         self.sigma = self.sigma + 1e-1 * np.eye(self.sigma.shape[1])
 
+        return log_probabilities_sum / E
+
     @staticmethod
     def calculate_mu(z: list, gamma):
         """Calculate the kernel of the outer sum in the update equations for mu."""
@@ -961,21 +1522,9 @@ class GaussianHiddenMarkovModel(HiddenMarkovModel):
     @staticmethod
     def calculate_sigma(z, mu, gamma):
         z_array = np.array(z).reshape(gamma.shape[0], -1)
-        T = z_array.shape[0]
-        D = z_array.shape[1]
-        M = gamma.shape[1]
-        sigma = []
-        for m in range(M):
-            comps = []
-            for t in range(T):
-                arr = (z_array[t, :] - mu[m, :]).reshape(D, 1)
-                comps.append(gamma[t, m] * np.matmul(arr, arr.T))
-            comps = np.array(comps)
-            assert comps.shape == (T, D, D)
-            sum_over_t = np.sum(comps, axis=0)
-            assert sum_over_t.shape == (D, D)
-            sigma.append(sum_over_t)
-
-        sigma_numerator = np.array(sigma)
+        # Deviations from the mean of each state, with shape (M, T, D)
+        difference = z_array[np.newaxis, :, :] - mu[:, np.newaxis, :]
+        # Gamma-weighted sum over time of the outer products, with shape (M, D, D)
+        sigma_numerator = np.einsum("tm,mtd,mte->mde", gamma, difference, difference)
         sigma_denominator = np.sum(gamma, axis=0)
         return sigma_numerator, sigma_denominator
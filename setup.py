@@ -17,5 +17,6 @@ setup(
     license="MIT",
     packages=["hmmpy"],
     include_package_data=True,
-    install_requires=["numpy", "scipy", "tqdm"]
+    install_requires=["numpy", "scipy", "tqdm"],
+    extras_require={"numba": ["numba"]},
 )
\ No newline at end of file
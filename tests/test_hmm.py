@@ -1,13 +1,21 @@
 import pytest
 import numpy as np
 
-from scipy.stats import norm
+from itertools import product
 
+from scipy.stats import norm, multivariate_normal
+
+from hmmpy import hmm
 from hmmpy.hmm import (
     TransitionProbability,
     EmissionProbability,
+    EmissionProbabilityBase,
     InitialProbability,
     HiddenMarkovModel,
+    GaussianEmissionProbability,
+    DiscreteEmissionProbability,
+    DiscreteHiddenMarkovModel,
+    GaussianHiddenMarkovModel,
 )
 
 np.random.seed(0)
@@ -16,6 +24,31 @@ OBSERVATIONS = np.random.choice(np.arange(10), size=10).tolist()
 TRANSITION_MATRIX = np.ones((10, 10)) * 1 / 10
 STATES = np.arange(10).tolist()
 
+SMALL_P = np.array([[0.7, 0.3], [0.4, 0.6]])
+SMALL_PI = np.array([0.6, 0.4])
+
+
+def reference_expectation(P, l, pi):
+    """Unscaled forward-backward, one time step at a time, for short sequences.
+    Returns gamma, ksi and the log-probability of the sequence."""
+    N, M = l.shape
+    alpha = np.zeros((N, M))
+    beta = np.ones((N, M))
+    alpha[0] = pi * l[0]
+    for n in range(1, N):
+        alpha[n] = (alpha[n - 1] @ P) * l[n]
+    for n in range(N - 2, -1, -1):
+        beta[n] = P @ (l[n + 1] * beta[n + 1])
+    probability = np.sum(alpha[-1])
+    gamma = alpha * beta / probability
+    ksi = np.array(
+        [
+            np.outer(alpha[n], l[n + 1] * beta[n + 1]) * P / probability
+            for n in range(N - 1)
+        ]
+    )
+    return gamma, ksi, np.log(probability)
+
 
 @pytest.fixture
 def transition_probability():
@@ -77,6 +110,130 @@ class TestEmissionProbability:
         assert res.shape == a.shape == b.shape
         assert np.sum(res) == norm.pdf(1) * 3
 
+    def test_l(self, emission_probability):
+        def scalar_only(z, x):
+            return float(norm.pdf(z, loc=x))
+
+        scalar_emission_probability = EmissionProbability(scalar_only, STATES)
+        res = emission_probability.l(OBSERVATIONS)
+        assert res.shape == (len(OBSERVATIONS), len(STATES))
+        assert np.allclose(res, scalar_emission_probability.l(OBSERVATIONS))
+
+    def test_l_ragged_observations(self):
+        def by_length(z, x):
+            return 0.9 if len(z) == x else 0.1
+
+        ragged_emission_probability = EmissionProbability(by_length, [1, 2, 3])
+        res = ragged_emission_probability.l([[1], [1, 2], [1, 2, 3], [1]])
+        assert np.allclose(
+            res, [[0.9, 0.1, 0.1], [0.1, 0.9, 0.1], [0.1, 0.1, 0.9], [0.9, 0.1, 0.1]]
+        )
+
+    def test_l_original_observations(self):
+        def exact(z, x):
+            assert isinstance(z, (int, str))
+            return 0.9 if z == x else 0.1
+
+        mixed_emission_probability = EmissionProbability(exact, [0, 1])
+        res = mixed_emission_probability.l([0, "a", 1, 0])
+        assert np.allclose(res, [[0.9, 0.1], [0.1, 0.1], [0.1, 0.9], [0.9, 0.1]])
+        res = mixed_emission_probability.l([0, 1, 1, 0])
+        assert np.allclose(res, [[0.9, 0.1], [0.1, 0.9], [0.1, 0.9], [0.9, 0.1]])
+
+    def test_subclass(self, emission_probability):
+        class OnlyEvalToArray(EmissionProbabilityBase):
+            def __init__(self):
+                self.state_ids = np.arange(len(STATES))
+
+            def eval_to_array(self, z, x):
+                return norm.pdf(z, loc=x)
+
+        class OwnL(OnlyEvalToArray):
+            def l(self, z):
+                return np.ones((len(z), len(STATES)))
+
+        assert np.allclose(
+            OnlyEvalToArray().l(OBSERVATIONS), emission_probability.l(OBSERVATIONS)
+        )
+        assert np.all(OwnL().l(OBSERVATIONS) == 1)
+
+    def test_l_parallel(self, emission_probability):
+        def scalar_only(z, x):
+            return float(norm.pdf(z, loc=x))
+
+        threaded_emission_probability = EmissionProbability(
+            scalar_only, STATES, n_jobs=3
+        )
+        res = threaded_emission_probability.l(OBSERVATIONS)
+        assert np.allclose(res, emission_probability.l(OBSERVATIONS))
+
+    def test_l_numba(self, emission_probability):
+        numba = pytest.importorskip("numba")
+
+        @numba.njit
+        def compiled(z, x):
+            return np.exp(-0.5 * (z - x) ** 2) / np.sqrt(2 * np.pi)
+
+        compiled_emission_probability = EmissionProbability(compiled, STATES)
+        res = compiled_emission_probability.l(OBSERVATIONS)
+        assert np.allclose(res, emission_probability.l(OBSERVATIONS))
+
+
+class TestGaussianEmissionProbability:
+    def test_l(self):
+        mu = np.array([[0.0, 0.0], [1.0, -1.0], [3.0, 2.0]])
+        sigma = np.array([np.eye(2), [[2.0, 0.5], [0.5, 1.0]], 0.5 * np.eye(2)])
+        emission_probability = GaussianEmissionProbability(mu, sigma)
+        z = np.random.RandomState(0).normal(size=(20, 2))
+        res = emission_probability.l(z)
+        assert res.shape == (20, 3)
+        for m in range(3):
+            expected = multivariate_normal.pdf(z, mean=mu[m], cov=sigma[m])
+            assert np.allclose(res[:, m], np.clip(expected, 1e-9, None))
+
+    def test_sigma_in_place(self):
+        mu = np.array([[0.0, 0.0], [1.0, -1.0]])
+        sigma = np.array([np.eye(2), [[2.0, 0.5], [0.5, 1.0]]])
+        emission_probability = GaussianEmissionProbability(mu, sigma)
+        z = np.random.RandomState(0).normal(size=(5, 2))
+        emission_probability.log_pdf_batch(z)
+        emission_probability.sigma[0] = 0.01 * np.eye(2)
+        res = emission_probability.log_pdf_batch(z)
+        for m in range(2):
+            expected = multivariate_normal.logpdf(
+                z, mean=mu[m], cov=emission_probability.sigma[m]
+            )
+            assert np.allclose(res[:, m], expected)
+
+
+class TestDiscreteEmissionProbability:
+    def test_l(self):
+        symbols = ["x", "y", "z"]
+        B = np.array([[0.5, 0.2], [0.3, 0.3], [0.2, 0.5]])
+        emission_probability = DiscreteEmissionProbability(
+            lambda z, x: B[symbols.index(z), x], [0, 1], symbols
+        )
+        z = ["z", "x", "x", "y", "z"]
+        expected = [
+            [emission_probability.eval_to_array(o, m) for m in range(2)] for o in z
+        ]
+        assert np.allclose(emission_probability.l(z), expected)
+        assert np.allclose(emission_probability.l(np.array(z)), expected)
+        assert np.allclose(emission_probability.l(z), B[[2, 0, 0, 1, 2]])
+
+    def test_b(self):
+        symbols = ["x", "y", "z"]
+        states = [0, 1, 2, 3]
+        emission_probability = DiscreteEmissionProbability(
+            lambda z, x: symbols.index(z) + x + 1, states, symbols
+        )
+        expected = np.zeros((3, 4))
+        for k, symbol in enumerate(symbols):
+            for m, state in enumerate(states):
+                expected[k, m] = symbols.index(symbol) + state + 1
+        expected /= np.sum(expected, axis=0)
+        assert np.allclose(emission_probability.b, expected)
+
 
 class TestInitialProbability:
     def test_eval(self, initial_probability):
@@ -85,17 +242,193 @@ class TestInitialProbability:
         assert res.shape == a.shape
         assert np.sum(res) == pytest.approx(3 / 10)
 
+    def test_unscaled_pi(self):
+        initial_probability = InitialProbability(lambda x: 1, STATES)
+        assert np.allclose(initial_probability.pi, 1 / 10)
+        with pytest.warns(UserWarning):
+            InitialProbability(lambda x: 1, STATES, enable_warnings=True)
+
 
 class TestHiddenMarkovModel:
     def test_object_creation(self, hidden_markov_model, transition_probability):
         assert hidden_markov_model.M == 10
         assert np.all(hidden_markov_model.P == TRANSITION_MATRIX)
 
+    def test_object_creation_ragged_states(self):
+        states = ["start", ("a", 1)]
+        P = {("start", "start"): 1, ("start", ("a", 1)): 3}
+        hidden_markov_model = HiddenMarkovModel(
+            lambda x, y: P.get((x, y), 1),
+            lambda z, x: 0.9 if z == x else 0.1,
+            lambda x: 1 if x == "start" else 3,
+            states,
+        )
+        assert np.allclose(hidden_markov_model.P, [[0.25, 0.75], [0.5, 0.5]])
+        assert np.allclose(hidden_markov_model.pi, [0.25, 0.75])
+
     def test_viterbi(self, hidden_markov_model):
         most_likely_path = OBSERVATIONS
         viterbi_path = hidden_markov_model.viterbi(OBSERVATIONS)
         assert np.all(viterbi_path == np.array(most_likely_path))
 
+    def test_log_viterbi_internals_without_numba(
+        self, hidden_markov_model, monkeypatch
+    ):
+        observations = OBSERVATIONS * 5
+        P, l, pi = (
+            hidden_markov_model.P,
+            hidden_markov_model.l(observations),
+            hidden_markov_model.pi,
+        )
+        path = hidden_markov_model.log_viterbi_internals(observations, P, l, pi)
+        monkeypatch.setattr(hmm, "_log_viterbi_kernel", None)
+        numpy_path = hidden_markov_model.log_viterbi_internals(observations, P, l, pi)
+        assert np.all(path == numpy_path)
+
+    def test_parallel_log_viterbi_internals(self):
+        random_state = np.random.RandomState(1)
+        M = 4
+        P = random_state.dirichlet(np.ones(M), size=M)
+        # A forbidden transition
+        P[0, 1] = 0
+        P /= np.sum(P, axis=1, keepdims=True)
+        pi = random_state.dirichlet(np.ones(M))
+        l = random_state.uniform(0.05, 1, size=(50, M))
+        observations = list(range(50))
+
+        expected = HiddenMarkovModel.log_viterbi_internals(observations, P, l, pi)
+        for block_size in (1, 3, None):
+            path = HiddenMarkovModel.parallel_log_viterbi_internals(
+                observations, P, l, pi, block_size=block_size
+            )
+            assert np.all(path == expected)
+
+        # Exhaustive search over all paths of a short sequence
+        N = 6
+        with np.errstate(divide="ignore"):
+            log_P, log_l, log_pi = np.log(P), np.log(l[:N]), np.log(pi)
+        best_path = max(
+            product(range(M), repeat=N),
+            key=lambda path: log_pi[path[0]]
+            + sum(log_l[n, path[n]] for n in range(N))
+            + sum(log_P[path[n - 1], path[n]] for n in range(1, N)),
+        )
+        for block_size in (1, 3, None):
+            path = HiddenMarkovModel.parallel_log_viterbi_internals(
+                observations[:N], P, l[:N], pi, block_size=block_size
+            )
+            assert tuple(path) == best_path
+
+    def test_forward_backward_internals_without_numba(
+        self, hidden_markov_model, monkeypatch
+    ):
+        observations = OBSERVATIONS * 5
+        P, l, pi = (
+            hidden_markov_model.P,
+            hidden_markov_model.l(observations),
+            hidden_markov_model.pi,
+        )
+        c, alpha = hidden_markov_model.forward_algorithm_internals(
+            observations, P, l, pi
+        )
+        beta = hidden_markov_model.backward_algorithm_internals(
+            observations, P, l, pi, c
+        )
+        monkeypatch.setattr(hmm, "_forward_kernel", None)
+        monkeypatch.setattr(hmm, "_backward_kernel", None)
+        numpy_c, numpy_alpha = hidden_markov_model.forward_algorithm_internals(
+            observations, P, l, pi
+        )
+        numpy_beta = hidden_markov_model.backward_algorithm_internals(
+            observations, P, l, pi, numpy_c
+        )
+        assert np.allclose(c, numpy_c)
+        assert np.allclose(alpha, numpy_alpha)
+        assert np.allclose(beta, numpy_beta)
+
+    def test_expectation_steps_parallel(self, hidden_markov_model):
+        zs = [OBSERVATIONS * 2, OBSERVATIONS * 3, OBSERVATIONS]
+        sequential = list(hidden_markov_model.expectation_steps(zs))
+        hidden_markov_model.n_jobs = 2
+        parallel = list(hidden_markov_model.expectation_steps(zs))
+        for (gamma, ksi, log_probability), z in zip(sequential, zs):
+            hidden_markov_model.forward_backward_algorithm(z)
+            assert np.allclose(gamma, hidden_markov_model.gamma)
+            assert np.allclose(ksi, hidden_markov_model.ksi)
+            assert log_probability == pytest.approx(
+                hidden_markov_model.observation_log_probability(z)
+            )
+        for expected, actual in zip(sequential, parallel):
+            assert all(np.allclose(e, a) for e, a in zip(expected, actual))
+
+    def test_baum_welch_parallel_numba(self):
+        numba = pytest.importorskip("numba")
+
+        @numba.njit
+        def compiled(z, x):
+            return np.exp(-0.5 * (z - x) ** 2)
+
+        def model(n_jobs):
+            return HiddenMarkovModel(
+                lambda x, y: 0.5, compiled, lambda x: 0.5, [0, 1], n_jobs=n_jobs
+            )
+
+        zs = [
+            np.array(OBSERVATIONS[i:] + OBSERVATIONS[:i], dtype=float) % 2
+            for i in range(4)
+        ]
+        serial, parallel = model(None), model(4)
+        assert parallel.baum_welch(zs) == pytest.approx(serial.baum_welch(zs))
+        assert np.allclose(parallel.P, serial.P)
+        assert np.allclose(parallel.pi, serial.pi)
+
+    def test_float32(self, hidden_markov_model):
+        observations = OBSERVATIONS * 5
+        path = hidden_markov_model.viterbi(observations, dtype=np.float32)
+        assert np.all(path == hidden_markov_model.viterbi(observations))
+        hidden_markov_model.forward_algorithm(observations, dtype=np.float32)
+        assert hidden_markov_model.alpha.dtype == np.float32
+        alpha = hidden_markov_model.alpha
+        hidden_markov_model.forward_algorithm(observations)
+        assert np.allclose(alpha, hidden_markov_model.alpha, atol=1e-5)
+        hidden_markov_model.dtype = np.float32
+        hidden_markov_model.forward_backward_algorithm(observations)
+        assert hidden_markov_model.beta.dtype == np.float32
+        assert hidden_markov_model.ksi.dtype == np.float32
+        assert np.all(path == hidden_markov_model.viterbi(observations))
+
+    def test_log_P_and_log_pi_cached(self, hidden_markov_model):
+        assert np.allclose(hidden_markov_model.log_P, np.log(hidden_markov_model.P))
+        P = np.eye(10) + 1
+        hidden_markov_model.P = P
+        hidden_markov_model.pi = np.arange(10)
+        assert np.allclose(hidden_markov_model.log_P, np.log(hidden_markov_model.P))
+        assert hidden_markov_model.log_pi[0] == -np.inf
+        path = hidden_markov_model.viterbi(OBSERVATIONS)
+        expected = hidden_markov_model.log_viterbi_internals(
+            OBSERVATIONS,
+            hidden_markov_model.P,
+            hidden_markov_model.l(OBSERVATIONS),
+            hidden_markov_model.pi,
+        )
+        assert np.all(path == expected)
+        with pytest.raises(ValueError):
+            hidden_markov_model.P[0, 0] = 0
+        P = hidden_markov_model.P.copy()
+        P[0, :] = 0
+        P[0, 1] = 1
+        hidden_markov_model.P = P
+        assert np.all(hidden_markov_model.log_P[0, 2:] == -np.inf)
+
+    def test_baum_welch_update_matrix(self, hidden_markov_model):
+        update_matrix = np.ones((10, 10))
+        update_matrix[0, :] = 0
+        hidden_markov_model.update_matrix = update_matrix
+        previous_P = hidden_markov_model.P
+        hidden_markov_model.baum_welch([OBSERVATIONS * 2, OBSERVATIONS])
+        assert np.allclose(hidden_markov_model.P[0, :], previous_P[0, :])
+        assert not np.allclose(hidden_markov_model.P[1:, :], previous_P[1:, :])
+
     def test_decode(self, hidden_markov_model):
         most_likely_states = hidden_markov_model.decode(OBSERVATIONS)
         assert most_likely_states == list(map(lambda x: x, OBSERVATIONS))
@@ -104,7 +437,19 @@ class TestHiddenMarkovModel:
         observations = np.random.choice(np.arange(10), size=10)
         hidden_markov_model.forward_algorithm(observations)
         probability = np.sum(hidden_markov_model.alpha[-1, :])
-        assert 0 < probability <= 1
+        # alpha is scaled to sum to one at every step, up to rounding
+        assert probability == pytest.approx(1)
+
+    def test_log_forward_algorithm(self, hidden_markov_model):
+        observations = OBSERVATIONS * 5
+        hidden_markov_model.log_forward_algorithm(observations)
+        log_alpha = hidden_markov_model.log_alpha
+        log_probability = hidden_markov_model.observation_log_probability(observations)
+        assert np.logaddexp.reduce(log_alpha[-1, :]) == pytest.approx(log_probability)
+        scaled_alpha = np.exp(
+            log_alpha - np.logaddexp.reduce(log_alpha, axis=1)[:, np.newaxis]
+        )
+        assert np.allclose(scaled_alpha, hidden_markov_model.alpha)
 
     def test_backward_algorithm(self, hidden_markov_model):
         observations = np.random.choice(np.arange(10), size=10)
@@ -134,3 +479,151 @@ class TestHiddenMarkovModel:
 
         hidden_markov_model.calculate_gamma()
         assert np.sum(np.sum(hidden_markov_model.gamma, axis=1)) == pytest.approx(len(observations))
+
+
+class TestDiscreteHiddenMarkovModel:
+    def test_viterbi_mixed_symbols(self):
+        symbols = [1, "a"]
+        discrete_hidden_markov_model = DiscreteHiddenMarkovModel(
+            lambda x, y: 0.5,
+            lambda z, x: 0.9 if symbols.index(z) == x else 0.1,
+            lambda x: 0.5,
+            [0, 1],
+            symbols,
+        )
+        observations = [1, "a", 1, 1]
+        assert np.all(
+            discrete_hidden_markov_model.emission_probability.symbol_ids(observations)
+            == [0, 1, 0, 0]
+        )
+        assert discrete_hidden_markov_model.decode(observations) == [0, 1, 0, 0]
+
+    def test_calculate_inner_emission_probability_sums(self):
+        symbols = ["x", "y", "z"]
+        z = ["z", "x", "x", "y", "z", "x"]
+        gamma = np.random.RandomState(0).dirichlet(np.ones(4), size=len(z))
+        numerator_sum, denominator_sum = (
+            DiscreteHiddenMarkovModel.calculate_inner_emission_probability_sums(
+                z, gamma, symbols
+            )
+        )
+        expected = np.zeros((3, 4))
+        for k, symbol in enumerate(symbols):
+            for n, observation in enumerate(z):
+                if observation == symbol:
+                    expected[k, :] += gamma[n, :]
+        assert np.allclose(numerator_sum, expected)
+        assert np.allclose(denominator_sum, np.sum(gamma, axis=0))
+
+    def test_baum_welch(self):
+        symbols = ["x", "y", "z"]
+        B = np.array([[0.5, 0.2], [0.3, 0.3], [0.2, 0.5]])
+        discrete_hidden_markov_model = DiscreteHiddenMarkovModel(
+            lambda x, y: SMALL_P[x, y],
+            lambda z, x: B[symbols.index(z), x],
+            lambda x: SMALL_PI[x],
+            [0, 1],
+            symbols,
+        )
+        random_state = np.random.RandomState(0)
+        zs = [random_state.choice(symbols, size=size).tolist() for size in (6, 8, 5)]
+
+        P_numerator, P_denominator = np.zeros((2, 2)), np.zeros(2)
+        b_numerator, b_denominator = np.zeros((3, 2)), np.zeros(2)
+        pi, log_probability = np.zeros(2), 0.0
+        for z in zs:
+            ids = [symbols.index(o) for o in z]
+            gamma, ksi, sequence_log_probability = reference_expectation(
+                SMALL_P, B[ids], SMALL_PI
+            )
+            P_numerator += np.sum(ksi, axis=0)
+            P_denominator += np.sum(gamma[:-1], axis=0)
+            for n, k in enumerate(ids):
+                b_numerator[k] += gamma[n]
+            b_denominator += np.sum(gamma, axis=0)
+            pi += gamma[0] / len(zs)
+            log_probability += sequence_log_probability / len(zs)
+
+        assert discrete_hidden_markov_model.baum_welch(zs) == pytest.approx(
+            log_probability
+        )
+        assert np.allclose(
+            discrete_hidden_markov_model.P, P_numerator / P_denominator[:, np.newaxis]
+        )
+        assert np.allclose(discrete_hidden_markov_model.b, b_numerator / b_denominator)
+        assert np.allclose(discrete_hidden_markov_model.pi, pi)
+
+
+class TestGaussianHiddenMarkovModel:
+    def test_calculate_sigma(self):
+        random_state = np.random.RandomState(0)
+        z = random_state.normal(size=(7, 2))
+        mu = random_state.normal(size=(3, 2))
+        gamma = random_state.dirichlet(np.ones(3), size=7)
+        sigma_numerator, sigma_denominator = GaussianHiddenMarkovModel.calculate_sigma(
+            z, mu, gamma
+        )
+        expected = np.zeros((3, 2, 2))
+        for m in range(3):
+            for t in range(7):
+                expected[m] += gamma[t, m] * np.outer(z[t] - mu[m], z[t] - mu[m])
+        assert np.allclose(sigma_numerator, expected)
+        assert np.allclose(sigma_denominator, np.sum(gamma, axis=0))
+
+    def test_baum_welch(self):
+        mu = np.array([[0.0, 0.0], [1.0, 1.0]])
+        sigma = np.array([np.eye(2), [[1.0, 0.3], [0.3, 1.0]]])
+        gaussian_hidden_markov_model = GaussianHiddenMarkovModel(
+            lambda x, y: SMALL_P[x, y],
+            lambda x: SMALL_PI[x],
+            [0, 1],
+            mu.copy(),
+            sigma.copy(),
+        )
+        random_state = np.random.RandomState(0)
+        zs = [random_state.normal(loc=0.5, size=(size, 2)) for size in (6, 8, 5)]
+
+        P_numerator, P_denominator = np.zeros((2, 2)), np.zeros(2)
+        mu_numerator, sigma_numerator, denominator = (
+            np.zeros((2, 2)),
+            np.zeros((2, 2, 2)),
+            np.zeros(2),
+        )
+        pi, log_probability = np.zeros(2), 0.0
+        for z in zs:
+            l = np.array(
+                [
+                    [
+                        multivariate_normal.pdf(o, mean=mu[m], cov=sigma[m])
+                        for m in range(2)
+                    ]
+                    for o in z
+                ]
+            )
+            gamma, ksi, sequence_log_probability = reference_expectation(
+                SMALL_P, l, SMALL_PI
+            )
+            P_numerator += np.sum(ksi, axis=0)
+            P_denominator += np.sum(gamma[:-1], axis=0)
+            for t, o in enumerate(z):
+                for m in range(2):
+                    mu_numerator[m] += gamma[t, m] * o
+                    sigma_numerator[m] += gamma[t, m] * np.outer(o - mu[m], o - mu[m])
+            denominator += np.sum(gamma, axis=0)
+            pi += gamma[0] / len(zs)
+            log_probability += sequence_log_probability / len(zs)
+
+        assert gaussian_hidden_markov_model.baum_welch(zs) == pytest.approx(
+            log_probability
+        )
+        assert np.allclose(
+            gaussian_hidden_markov_model.P, P_numerator / P_denominator[:, np.newaxis]
+        )
+        assert np.allclose(gaussian_hidden_markov_model.pi, pi)
+        assert np.allclose(
+            gaussian_hidden_markov_model.mu, mu_numerator / denominator[:, np.newaxis]
+        )
+        expected_sigma = sigma_numerator / denominator[
+            :, np.newaxis, np.newaxis
+        ] + 1e-1 * np.eye(2)
+        assert np.allclose(gaussian_hidden_markov_model.sigma, expected_sigma)